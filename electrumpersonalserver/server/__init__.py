@@ -15,7 +15,9 @@ from electrumpersonalserver.server.hashes import (
     hash_merkle_root,
     hash_160,
     script_to_address,
+    scripts_to_addresses,
     address_to_script,
+    addresses_to_scripts,
     address_to_scripthash,
     bytes_fmt,
 )
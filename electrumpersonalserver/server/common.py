@@ -1,5 +1,6 @@
 import socket
 import time
+import threading
 from datetime import datetime
 import ssl
 import os
@@ -10,8 +11,13 @@ import platform
 import json
 import traceback
 from json.decoder import JSONDecodeError
-from configparser import RawConfigParser, NoSectionError, NoOptionError
+from configparser import RawConfigParser, NoSectionError
 from ipaddress import ip_network, ip_address
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from electrumpersonalserver.server.jsonrpc import JsonRpc, JsonRpcError
 import electrumpersonalserver.server.hashes as hashes
@@ -31,6 +37,8 @@ from electrumpersonalserver.server.mempoolhistogram import (
     PollIntervalChange
 )
 
+logger = logging.getLogger('ELECTRUMPERSONALSERVER')
+
 ##python has demented rules for variable scope, so these
 ## global variables are actually mutable lists
 bestblockhash = [None]
@@ -38,18 +46,38 @@ bestblockhash = [None]
 last_heartbeat_listening = [datetime.now()]
 last_heartbeat_connected = [datetime.now()]
 
+#height -> (blockhash, time) of headers already fetched by the rescan script
+header_by_height = {}
+#number of extra heights probed alongside each guess when searching for the
+# block height of a date
+SPECULATIVE_WIDTH = 2
+RESCAN_PROGRESS_INTERVAL = 10 #seconds
+
+def json_dumps_line(obj):
+    """Serialize obj to a newline-terminated line of utf-8 encoded json,
+    using orjson if installed"""
+    if orjson is not None:
+        #adding the newline while serializing saves copying the whole reply
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj) + '\n').encode('utf-8')
+
+def json_loads_bytes(data):
+    """Parse utf-8 encoded json from a bytes-like object, using orjson if
+    installed. Raises JSONDecodeError or UnicodeDecodeError if invalid"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(str(data, 'utf-8'))
+
 def on_heartbeat_listening(poll_interval_listening, txmonitor):
     if ((datetime.now() - last_heartbeat_listening[0]).total_seconds()
             < poll_interval_listening):
         return True
     last_heartbeat_listening[0] = datetime.now()
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
     try:
         txmonitor.check_for_updated_txes()
         is_node_reachable = True
     except JsonRpcError as e:
         is_node_reachable = False
-        logger = logging.getLogger('ELECTRUMPERSONALSERVER')
         logger.debug("Error with node connection, e = " + repr(e)
             + "\ntraceback = " + str(traceback.format_exc()))
     return is_node_reachable
@@ -59,7 +87,6 @@ def on_heartbeat_connected(poll_interval_connected, rpc, txmonitor, protocol):
             < poll_interval_connected):
         return
     last_heartbeat_connected[0] = datetime.now()
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
     is_tip_updated, header = check_for_new_blockchain_tip(rpc,
         protocol.are_headers_raw)
     if is_tip_updated:
@@ -76,7 +103,6 @@ def check_for_new_blockchain_tip(rpc, raw):
     return is_tip_new, header
 
 def create_server_socket(hostport):
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
     server_sock = socket.socket()
     server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_sock.bind(hostport)
@@ -87,7 +113,6 @@ def create_server_socket(hostport):
     return server_sock
 
 def run_electrum_server(rpc, txmonitor, config):
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
     logger.debug("Starting electrum server")
 
     hostport = (config.get("electrum-server", "host"),
@@ -106,6 +131,8 @@ def run_electrum_server(rpc, txmonitor, config):
         "poll_interval_connected"))
     certfile, keyfile = get_certs(config)
     logger.debug('using cert: {}, key: {}'.format(certfile, keyfile))
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(certfile, keyfile)
     disable_mempool_fee_histogram = config.getboolean("electrum-server",
         "disable_mempool_fee_histogram", fallback=False)
     mempool_update_interval = int(config.get("bitcoin-rpc",
@@ -126,6 +153,9 @@ def run_electrum_server(rpc, txmonitor, config):
     normal_listening_timeout = min(poll_interval_listening,
         mempool_update_interval)
     fast_listening_timeout = 0.5
+    #the tls handshake blocks the loop, so a client who stalls in the
+    # middle of it must not be able to hold up polling the node for long
+    handshake_timeout = 5
     server_sock = create_server_socket(hostport)
     server_sock.settimeout(normal_listening_timeout)
     accepting_clients = True
@@ -140,13 +170,22 @@ def run_electrum_server(rpc, txmonitor, config):
                     logger.debug("Refusing connection from client because"
                         + " Bitcoin node isnt reachable")
                     raise ConnectionRefusedError()
-                if not any([ip_address(addr[0]) in ipnet
-                        for ipnet in ip_whitelist]):
+                client_ip = ip_address(addr[0])
+                if not any(client_ip in ipnet for ipnet in ip_whitelist):
                     logger.debug(addr[0] + " not in whitelist, closing")
                     raise ConnectionRefusedError()
-                sock = ssl.wrap_socket(sock, server_side=True,
-                    certfile=certfile, keyfile=keyfile,
-                    ssl_version=ssl.PROTOCOL_SSLv23)
+                #replies and notifications are small and latency sensitive,
+                # so dont let nagle's algorithm hold them back
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                #notice wallets which disappeared without closing the socket
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                sock.settimeout(handshake_timeout)
+                try:
+                    sock = ssl_context.wrap_socket(sock, server_side=True)
+                except socket.timeout:
+                    logger.debug("Timed out during TLS handshake with "
+                        + addr[0])
+                    raise ConnectionRefusedError()
             except socket.timeout:
                 poll_interval_change = mempool_sync.poll_update(1)
                 if poll_interval_change == PollIntervalChange.FAST_POLLING:
@@ -163,9 +202,12 @@ def run_electrum_server(rpc, txmonitor, config):
         logger.debug('Electrum connected from ' + str(addr[0]))
 
         def send_reply_fun(reply):
-            line = json.dumps(reply)
-            sock.sendall(line.encode('utf-8') + b'\n')
-            logger.debug('<= ' + line)
+            line = json_dumps_line(reply)
+            sock.sendall(line)
+            #the file handler logs at debug level so this runs for every
+            # reply, decode straight from a view to avoid copying the bytes
+            with memoryview(line) as view:
+                logger.debug('<= %s', str(view[:-1], 'utf-8'))
         protocol.set_send_reply_fun(send_reply_fun)
 
         try:
@@ -174,6 +216,9 @@ def run_electrum_server(rpc, txmonitor, config):
             fast_connected_timeout = 0.5
             sock.settimeout(normal_connected_timeout)
             recv_buffer = bytearray()
+            #lines before read_pos have already been handled, they are only
+            # removed from the buffer once in a while to avoid copying it
+            read_pos = 0
             while True:
                 # loop for replying to client queries
                 try:
@@ -181,20 +226,27 @@ def run_electrum_server(rpc, txmonitor, config):
                     if not recv_data or len(recv_data) == 0:
                         raise EOFError()
                     recv_buffer.extend(recv_data)
-                    lb = recv_buffer.find(b'\n')
-                    if lb == -1:
-                        continue
+                    lb = recv_buffer.find(b'\n', read_pos)
                     while lb != -1:
-                        line = recv_buffer[:lb].rstrip()
-                        recv_buffer = recv_buffer[lb + 1:]
-                        lb = recv_buffer.find(b'\n')
                         try:
-                            line = line.decode("utf-8")
-                            query = json.loads(line)
+                            #parse straight from the buffer without first
+                            # copying the line out of it
+                            with memoryview(recv_buffer) as view:
+                                line = view[read_pos:lb]
+                                query = json_loads_bytes(line)
+                                logger.debug("=> %s", str(line, "utf-8"))
+                                line.release()
                         except (UnicodeDecodeError, JSONDecodeError) as e:
                             raise IOError(repr(e))
-                        logger.debug("=> " + line)
+                        read_pos = lb + 1
+                        lb = recv_buffer.find(b'\n', read_pos)
                         protocol.handle_query(query)
+                    if read_pos == len(recv_buffer):
+                        recv_buffer.clear()
+                        read_pos = 0
+                    elif read_pos > 4096:
+                        del recv_buffer[:read_pos]
+                        read_pos = 0
                 except socket.timeout:
                     poll_interval_change = mempool_sync.poll_update(1)
                     if poll_interval_change == PollIntervalChange.FAST_POLLING:
@@ -228,15 +280,22 @@ def run_electrum_server(rpc, txmonitor, config):
 def is_address_imported(rpc, address):
     return rpc.call("getaddressinfo", [address])["iswatchonly"]
 
+def are_addresses_imported(rpc, addresses):
+    addrinfos = rpc.batch_call([("getaddressinfo", [a]) for a in addresses])
+    return [addrinfo["iswatchonly"] for addrinfo in addrinfos]
+
 def get_scriptpubkeys_to_monitor(rpc, config):
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
     st = time.time()
 
+    gaplimit = int(config.get("bitcoin-rpc", "gap_limit"))
+    initial_import_count = int(config.get("bitcoin-rpc",
+        "initial_import_count"))
+    mpk_keys = config.options("master-public-keys")
+    chain = rpc.call("getblockchaininfo", [])["chain"] if mpk_keys else None
+
     deterministic_wallets = []
-    for key in config.options("master-public-keys"):
+    for key in mpk_keys:
         mpk = config.get("master-public-keys", key)
-        gaplimit = int(config.get("bitcoin-rpc", "gap_limit"))
-        chain = rpc.call("getblockchaininfo", [])["chain"]
         try:
             wal = deterministicwallet.parse_electrum_master_public_key(mpk,
                 gaplimit, rpc, chain)
@@ -250,16 +309,14 @@ def get_scriptpubkeys_to_monitor(rpc, config):
     TEST_ADDR_COUNT = 3
     logger.info("Displaying first " + str(TEST_ADDR_COUNT) + " addresses of " +
         "each master public key:")
-    for config_mpk_key, wal in zip(config.options("master-public-keys"),
-            deterministic_wallets):
+    for config_mpk_key, wal in zip(mpk_keys, deterministic_wallets):
         first_addrs, first_spk = wal.get_addresses(change=0, from_index=0,
             count=TEST_ADDR_COUNT)
         logger.info("\n" + config_mpk_key + " =>\n\t" + "\n\t".join(
             first_addrs))
-        last_addr, last_spk = wal.get_addresses(change=0, from_index=int(
-            config.get("bitcoin-rpc", "initial_import_count")) - 1, count=1)
-        if not all((is_address_imported(rpc, a) for a in (first_addrs
-                + last_addr))):
+        last_addr, last_spk = wal.get_addresses(change=0,
+            from_index=initial_import_count - 1, count=1)
+        if not all(are_addresses_imported(rpc, first_addrs + last_addr)):
             import_needed = True
             wallets_to_import.append(wal)
     logger.info("Obtaining bitcoin addresses to monitor . . .")
@@ -268,8 +325,9 @@ def get_scriptpubkeys_to_monitor(rpc, config):
     for key in config.options("watch-only-addresses"):
         watch_only_addresses.extend(config.get("watch-only-addresses",
             key).split(' '))
-    watch_only_addresses_to_import = [a for a in watch_only_addresses
-        if not is_address_imported(rpc, a)]
+    watch_only_addresses_to_import = [a for a, imported in zip(
+        watch_only_addresses, are_addresses_imported(rpc,
+        watch_only_addresses)) if not imported]
     if len(watch_only_addresses_to_import) > 0:
         import_needed = True
 
@@ -297,7 +355,7 @@ def get_scriptpubkeys_to_monitor(rpc, config):
     for wal in deterministic_wallets:
         for change in [0, 1]:
             addrs, spks = wal.get_addresses(change, 0,
-                int(config.get("bitcoin-rpc", "initial_import_count")))
+                initial_import_count)
             spks_to_monitor.extend(spks)
             #loop until one address found that isnt imported
             while True:
@@ -307,8 +365,8 @@ def get_scriptpubkeys_to_monitor(rpc, config):
                 spks_to_monitor.append(spks[0])
             wal.rewind_one(change)
 
-    spks_to_monitor.extend([hashes.address_to_script(addr, rpc)
-        for addr in watch_only_addresses])
+    spks_to_monitor.extend(hashes.addresses_to_scripts(watch_only_addresses,
+        rpc))
     et = time.time()
     logger.info("Obtained list of addresses to monitor in " + str(et - st)
         + "sec")
@@ -318,7 +376,6 @@ def get_certs(config):
     from pkg_resources import resource_filename
     from electrumpersonalserver import __certfile__, __keyfile__
 
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
     certfile = config.get('electrum-server', 'certfile', fallback=None)
     keyfile = config.get('electrum-server', 'keyfile', fallback=None)
     if (certfile and keyfile) and \
@@ -334,7 +391,6 @@ def get_certs(config):
                 certfile, keyfile))
 
 def obtain_cookie_file_path(datadir):
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
     if len(datadir.strip()) == 0:
         logger.debug("no datadir configuration, checking in default location")
         systemname = platform.system()
@@ -361,9 +417,18 @@ def parse_args():
                         help='configuration file (mandatory)')
     parser.add_argument("--rescan", action="store_true", help="Start the " +
         " rescan script instead")
-    parser.add_argument("--rescan-date", action="store", dest="rescan_date",
-        default=None, help="Earliest wallet creation date (DD/MM/YYYY) or "
-        + "block height to rescan from")
+    rescan_from = parser.add_mutually_exclusive_group()
+    rescan_from.add_argument("--rescan-date", action="store",
+        dest="rescan_date", default=None, help="Earliest wallet creation date"
+        + " (DD/MM/YYYY) or block height to rescan from")
+    rescan_from.add_argument("--from-height", action="store", type=int,
+        dest="from_height", default=None, help="Block height to rescan from,"
+        + " implies --rescan")
+    rescan_from.add_argument("--from-date", action="store", dest="from_date",
+        default=None, help="Earliest wallet creation date (DD/MM/YYYY) to"
+        + " rescan from, implies --rescan")
+    parser.add_argument("-y", "--yes", action="store_true", help="Start the"
+        + " rescan without asking for confirmation")
     parser.add_argument("-v", "--version", action="version", version=
         "%(prog)s " + SERVER_VERSION_NUMBER)
     return parser.parse_args()
@@ -400,29 +465,28 @@ def main():
         print("ERROR: Non-existant configuration file {}".format(
             opts.config_file))
         return 1
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
-    logger, logfilename = logger_config(logger, config)
-    logger.info('Starting Electrum Personal Server ' + str(
-        SERVER_VERSION_NUMBER))
-    logger.info('Logging to ' + logfilename)
-    logger.debug("Process ID (PID) = " + str(os.getpid()))
-    rpc_u = None
-    rpc_p = None
+    logfilename = logger_config(logger, config)[1]
+    logger.info('Starting Electrum Personal Server %s', SERVER_VERSION_NUMBER)
+    logger.info('Logging to %s', logfilename)
+    logger.debug("Process ID (PID) = %s", os.getpid())
+    #read the [bitcoin-rpc] section once instead of going through the
+    # config parser for every option
+    rpc_config = dict(config.items("bitcoin-rpc"))
+    initial_import_count = int(rpc_config["initial_import_count"])
+    rpc_u = rpc_config.get("rpc_user")
+    rpc_p = rpc_config.get("rpc_password")
     cookie_path = None
-    try:
-        rpc_u = config.get("bitcoin-rpc", "rpc_user")
-        rpc_p = config.get("bitcoin-rpc", "rpc_password")
+    if rpc_u != None and rpc_p != None:
         logger.debug("obtaining auth from rpc_user/pass")
-    except NoOptionError:
-        cookie_path = obtain_cookie_file_path(config.get(
-            "bitcoin-rpc", "datadir"))
+    else:
+        cookie_path = obtain_cookie_file_path(rpc_config["datadir"])
         logger.debug("obtaining auth from .cookie")
     if rpc_u == None and cookie_path == None:
         return 1
-    rpc = JsonRpc(host = config.get("bitcoin-rpc", "host"),
-        port = int(config.get("bitcoin-rpc", "port")),
+    rpc = JsonRpc(host = rpc_config["host"],
+        port = int(rpc_config["port"]),
         user = rpc_u, password = rpc_p, cookie_path = cookie_path,
-        wallet_filename=config.get("bitcoin-rpc", "wallet_filename").strip(),
+        wallet_filename=rpc_config["wallet_filename"].strip(),
         logger=logger)
 
     #TODO somewhere here loop until rpc works and fully sync'd, to allow
@@ -435,7 +499,7 @@ def main():
             bestblockhash[0] = rpc.call("getbestblockhash", [])
         except JsonRpcError as e:
             if not printed_error_msg:
-                logger.error("Error with bitcoin json-rpc: " + repr(e))
+                logger.error("Error with bitcoin json-rpc: %r", e)
                 printed_error_msg = True
             time.sleep(5)
     try:
@@ -461,8 +525,9 @@ def main():
         logger.error("Descriptor related RPC call failed. Bitcoin Core 0.20.0"
             + " or higher required. Exiting..")
         return 1
-    if opts.rescan:
-        rescan_script(logger, rpc, opts.rescan_date)
+    if opts.rescan or opts.from_height is not None or opts.from_date:
+        rescan_script(logger, rpc, opts.rescan_date, opts.from_height,
+            opts.from_date, opts.yes)
         return 0
     while True:
         logger.debug("Checking whether rescan is in progress")
@@ -480,7 +545,7 @@ def main():
             return 0
         deterministicwallet.import_addresses(rpc, relevant_spks_addrs,
             deterministic_wallets, change_param=-1,
-            count=int(config.get("bitcoin-rpc", "initial_import_count")))
+            count=initial_import_count)
         logger.info("Done.\nIf recovering a wallet which already has existing" +
             " transactions, then\nrun the rescan script. If you're confident" +
             " that the wallets are new\nand empty then there's no need to" +
@@ -497,55 +562,164 @@ def main():
             return 1
     return 0
 
-def search_for_block_height_of_date(datestr, rpc):
-    logger = logging.getLogger('ELECTRUMPERSONALSERVER')
-    target_time = datetime.strptime(datestr, "%d/%m/%Y")
-    bestblockhash = rpc.call("getbestblockhash", [])
-    best_head = rpc.call("getblockheader", [bestblockhash])
-    if target_time > datetime.fromtimestamp(best_head["time"]):
+def fetch_header(rpc, height):
+    blockhash = rpc.call("getblockhash", [height])
+    return blockhash, rpc.call("getblockheader", [blockhash])["time"]
+
+def get_headers_at(rpc, heights, pool=None):
+    """Returns a list of (blockhash, time) of the blocks at heights, asking
+    the node only for those not seen before. If pool is given the missing
+    headers are fetched concurrently on it, otherwise in batched requests"""
+    missing = [h for h in dict.fromkeys(heights) if h not in header_by_height]
+    if len(missing) == 0:
+        fetched = []
+    elif pool is None:
+        #two batched requests however many headers are needed
+        blockhashes = rpc.batch_call([("getblockhash", [h]) for h in missing])
+        fetched = [(blockhash, header["time"]) for blockhash, header in zip(
+            blockhashes, rpc.batch_call([("getblockheader", [blockhash])
+            for blockhash in blockhashes]))]
+    else:
+        fetched = pool.map(lambda h: fetch_header(rpc, h), missing)
+    for height, header in zip(missing, fetched):
+        header_by_height[height] = header
+    return [header_by_height[h] for h in heights]
+
+def search_for_block_height_of_date(datestr, rpc, pool=None):
+    target_time = int(datetime.strptime(datestr, "%d/%m/%Y").timestamp())
+    #fetch both ends of the chain with two batched requests
+    bestblockhash, genesis_hash = rpc.batch_call([("getbestblockhash", []),
+        ("getblockhash", [0])])
+    best_head, genesis_block = rpc.batch_call([
+        ("getblockheader", [bestblockhash]), ("getblockheader", [genesis_hash])])
+    header_by_height[0] = (genesis_hash, genesis_block["time"])
+    header_by_height[best_head["height"]] = (bestblockhash, best_head["time"])
+    if target_time > best_head["time"]:
         logger.error("date in the future")
         return -1
-    genesis_block = rpc.call("getblockheader", [rpc.call("getblockhash", [0])])
-    if target_time < datetime.fromtimestamp(genesis_block["time"]):
+    if target_time < genesis_block["time"]:
         logger.warning("date is before the creation of bitcoin")
         return 0
-    first_height = 0
-    last_height = best_head["height"]
+    first_height, first_time = 0, genesis_block["time"]
+    last_height, last_time = best_head["height"], best_head["time"]
+    bisect = False
     while True:
-        m = (first_height + last_height) // 2
-        m_header = rpc.call("getblockheader", [rpc.call("getblockhash", [m])])
-        m_header_time = datetime.fromtimestamp(m_header["time"])
-        m_time_diff = (m_header_time - target_time).total_seconds()
-        if abs(m_time_diff) < 60*60*2: #2 hours
-            return m_header["height"]
-        elif m_time_diff < 0:
-            first_height = m
-        elif m_time_diff > 0:
-            last_height = m
+        if last_height - first_height <= 1:
+            #no block is within the tolerance, e.g. after a long gap between
+            # blocks on testnet, so settle for the last one before the date
+            return first_height
+        #block times are roughly uniform so interpolating between the ends
+        # converges in far fewer steps than bisecting, but fall back to the
+        # midpoint whenever the last guess failed to halve the search range
+        span = last_height - first_height
+        if bisect or last_time <= first_time:
+            m = (first_height + last_height) // 2
         else:
-            return -1
-
-def rescan_script(logger, rpc, rescan_date):
-    if rescan_date:
-        user_input = rescan_date
-    else:
-        user_input = input("Enter earliest wallet creation date (DD/MM/YYYY) "
-            "or block height to rescan from: ")
-    try:
-        height = int(user_input)
-    except ValueError:
-        height = search_for_block_height_of_date(user_input, rpc)
+            m = first_height + int((target_time - first_time) * span
+                / (last_time - first_time))
+            m = max(first_height + 1, min(m, last_height - 1))
+        #the probes are fetched together so also probing evenly spaced
+        # heights either side of m costs no extra round trips, and shrinks
+        # the range whichever side of m the date turns out to be
+        probe_heights = [m]
+        per_side = SPECULATIVE_WIDTH // 2
+        for i in range(1, per_side + 1):
+            probe_heights.append(first_height + (m - first_height) * i
+                // (per_side + 1))
+            probe_heights.append(m + (last_height - m) * i // (per_side + 1))
+        probes = sorted(zip(probe_heights, get_headers_at(rpc, probe_heights,
+            pool)))
+        for height, (blockhash, block_time) in probes:
+            time_diff = block_time - target_time
+            if abs(time_diff) < 60*60*2: #2 hours
+                return height
+            elif height >= last_height:
+                continue
+            elif time_diff < 0:
+                first_height, first_time = height, block_time
+            elif time_diff > 0:
+                last_height, last_time = height, block_time
+            else:
+                return -1
+        bisect = (last_height - first_height) * 2 > span
+
+def rescan_script(logger, rpc, rescan_date, from_height=None, from_date=None,
+        assume_yes=False):
+    height = from_height
+    datestr = from_date
+    if height is None and datestr is None:
+        #--rescan-date and the prompt accept either a date or a height
+        if rescan_date:
+            user_input = rescan_date
+        else:
+            user_input = input("Enter earliest wallet creation date "
+                "(DD/MM/YYYY) or block height to rescan from: ")
+        try:
+            height = int(user_input)
+        except ValueError:
+            datestr = user_input
+    if height is None:
+        try:
+            datetime.strptime(datestr, "%d/%m/%Y")
+        except ValueError:
+            logger.error("Invalid date %r, expected DD/MM/YYYY", datestr)
+            return
+        with ThreadPoolExecutor(max_workers=1 + SPECULATIVE_WIDTH) as pool:
+            height = search_for_block_height_of_date(datestr, rpc, pool)
         if height == -1:
             return
         height -= 2016 #go back two weeks for safety
+    height = max(0, height)
 
-    if not rescan_date:
+    #check the height exists before starting a rescan that could take hours
+    try:
+        blockhash, block_time = get_headers_at(rpc, [height])[0]
+    except JsonRpcError as e:
+        logger.error("Block height %d not found: %r", height, e)
+        return
+    logger.info("Block %d %s was mined at %s", height, blockhash,
+        datetime.fromtimestamp(block_time))
+    if not (rescan_date or assume_yes):
         if input("Rescan from block height " + str(height) + " ? (y/n):") \
                 != 'y':
             return
-    logger.info("Rescanning. . . for progress indicator see the bitcoin node's"
-        + " debug.log file")
-    rpc.call("rescanblockchain", [height])
+    logger.info("Rescanning. . .")
+    #rescanblockchain only returns once the rescan is finished, so run it on
+    # another thread (which gets its own rpc connection) and poll progress
+    rescan_error = [None]
+    def rescan():
+        try:
+            rpc.call("rescanblockchain", [height])
+        except JsonRpcError as e:
+            rescan_error[0] = e
+    rescan_thread = threading.Thread(target=rescan, daemon=True)
+    rescan_thread.start()
+    try:
+        while True:
+            rescan_thread.join(RESCAN_PROGRESS_INTERVAL)
+            if not rescan_thread.is_alive():
+                break
+            try:
+                walletinfo = rpc.call("getwalletinfo", [])
+            except JsonRpcError as e:
+                logger.warning("Unable to get rescan progress: %r", e)
+                continue
+            if "scanning" in walletinfo and walletinfo["scanning"]:
+                logger.info("Rescan progress = %.1f%%",
+                    walletinfo["scanning"]["progress"] * 100)
+    except KeyboardInterrupt:
+        logger.info("Aborting rescan")
+        #the interrupt may have landed in the middle of a call, leaving an
+        # unread response on this thread's connection, so start a fresh one
+        rpc.conn.close()
+        try:
+            rpc.call("abortrescan", [])
+        except JsonRpcError as e:
+            logger.error("Failed to abort rescan: %r", e)
+        return
+    if rescan_error[0] is not None:
+        logger.error("Rescan failed: %r", rescan_error[0])
+        return
     logger.info("end")
 
 if __name__ == "__main__":
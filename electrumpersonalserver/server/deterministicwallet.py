@@ -3,7 +3,7 @@ import logging
 
 import electrumpersonalserver.bitcoin as btc
 from electrumpersonalserver.server.hashes import bh2u, hash_160, bfh, sha256,\
-    address_to_script, script_to_address
+    addresses_to_scripts, scripts_to_addresses
 from electrumpersonalserver.server.jsonrpc import JsonRpcError
 
 #the wallet types are here
@@ -109,6 +109,9 @@ class DeterministicWallet(object):
         self.gaplimit = 0
         self.next_index = [0, 0]
         self.scriptpubkey_index = {}
+        #(change, index) -> (address, scriptpubkey), deriving the same index
+        # always gives the same address so this never needs invalidating
+        self.derived_addresses = {}
         self.rpc = rpc
 
     def _derive_addresses(self, change, from_index, count):
@@ -116,8 +119,20 @@ class DeterministicWallet(object):
 
     def get_addresses(self, change, from_index, count):
         """Returns addresses from this deterministic wallet"""
-        addrs = self._derive_addresses(change, from_index, count)
-        spks = [address_to_script(a, self.rpc) for a in addrs]
+        indexes = range(from_index, from_index + count)
+        missing = [i for i in indexes
+            if (change, i) not in self.derived_addresses]
+        if len(missing) > 0:
+            #derive one range covering all the indexes not seen before
+            derive_from = missing[0]
+            derive_count = missing[-1] - derive_from + 1
+            new_addrs = self._derive_addresses(change, derive_from,
+                derive_count)
+            new_spks = addresses_to_scripts(new_addrs, self.rpc)
+            for i, addr_spk in enumerate(zip(new_addrs, new_spks)):
+                self.derived_addresses[(change, derive_from + i)] = addr_spk
+        addrs = [self.derived_addresses[(change, i)][0] for i in indexes]
+        spks = [self.derived_addresses[(change, i)][1] for i in indexes]
         for index, spk in enumerate(spks):
             self.scriptpubkey_index[spk] = (change, from_index + index)
         self.next_index[change] = max(self.next_index[change], from_index+count)
@@ -231,9 +246,8 @@ class SingleSigOldMnemonicWallet(DeterministicWallet):
         return "76a914" + pkh + "88ac"
 
     def _derive_addresses(self, change, from_index, count):
-        result = []
+        scriptpubkeys = []
         for index in range(from_index, from_index + count):
             pubkey = btc.electrum_pubkey(self.mpk, index, change)
-            scriptpubkey = self._pubkey_to_scriptpubkey(pubkey)
-            result.append(script_to_address(scriptpubkey, self.rpc))
-        return result
+            scriptpubkeys.append(self._pubkey_to_scriptpubkey(pubkey))
+        return scripts_to_addresses(scriptpubkeys, self.rpc)
@@ -1,15 +1,16 @@
 import json
 import datetime
 import time
-import binascii
 import os
 import struct
 import tempfile
 import socket
+import functools
 from collections import defaultdict
 
 from electrumpersonalserver.server.hashes import (
     hash_merkle_root,
+    hash_decode,
     get_status_electrum,
     bytes_fmt
 )
@@ -29,6 +30,9 @@ SERVER_PROTOCOL_VERSION_MIN = 1.1
 
 DONATION_ADDR = "bc1qe74qzd256kxevq2gn7gmscs564lfk5tqrxqsuy"
 
+#the banner shows slowly-changing node info, so it can be reused for a while
+BANNER_CACHE_TIME = 10 #seconds
+
 BANNER = \
 """Welcome to Electrum Personal Server {serverversion}
 
@@ -50,6 +54,9 @@ Donate to help improve Electrum Personal Server:
 
 """
 
+#version, prevblockhash, merkleroot, time, bits, nonce
+BLOCK_HEADER_STRUCT = struct.Struct("<i32s32sIII")
+
 class UnknownScripthashError(Exception):
     pass
 
@@ -72,18 +79,51 @@ def get_tor_hostport():
     return None
 
 
-def get_block_header(rpc, blockhash, raw=False):
+#unlike headers, the blockhash at a height can change in a reorg, so only
+# heights buried under enough confirmations are cached
+BLOCK_HASH_CACHE_MIN_CONFIRMATIONS = 6
+BLOCK_HASH_CACHE_SIZE = 4096
+block_hash_cache = {}
+
+def cache_block_hash(height, blockhash, confirmations):
+    if confirmations < BLOCK_HASH_CACHE_MIN_CONFIRMATIONS:
+        return
+    if (block_hash_cache.pop(height, None) is None
+            and len(block_hash_cache) >= BLOCK_HASH_CACHE_SIZE):
+        #dicts are ordered by insertion and every lookup through
+        # get_block_hash() or get_block_headers_hex() moves an entry to the
+        # end, so this evicts the least recently used one
+        del block_hash_cache[next(iter(block_hash_cache))]
+    block_hash_cache[height] = blockhash
+
+def get_block_hash(rpc, height):
+    #height comes from the client and may not even be hashable, anything
+    # other than an int is passed on for the node to reject
+    blockhash = None
+    if isinstance(height, int):
+        blockhash = block_hash_cache.pop(height, None)
+    if blockhash is None:
+        blockhash = rpc.call("getblockhash", [height])
+    else:
+        block_hash_cache[height] = blockhash
+    return blockhash
+
+#a block header never changes for a given blockhash, so they are cached
+# to save the RPC call when the same header is requested again
+@functools.lru_cache(maxsize=4096)
+def _get_block_header_cached(rpc, blockhash, raw):
     rpc_head = rpc.call("getblockheader", [blockhash])
+    cache_block_hash(rpc_head["height"], blockhash,
+        rpc_head.get("confirmations", 0))
     if "previousblockhash" in rpc_head:
         prevblockhash = rpc_head["previousblockhash"]
     else:
         prevblockhash = "00"*32 #genesis block
     if raw:
-        head_hex = struct.pack("<i32s32sIII", rpc_head["version"],
-            binascii.unhexlify(prevblockhash)[::-1],
-            binascii.unhexlify(rpc_head["merkleroot"])[::-1],
-            rpc_head["time"], int(rpc_head["bits"], 16), rpc_head["nonce"])
-        head_hex = binascii.hexlify(head_hex).decode("utf-8")
+        head_hex = BLOCK_HEADER_STRUCT.pack(rpc_head["version"],
+            hash_decode(prevblockhash), hash_decode(rpc_head["merkleroot"]),
+            rpc_head["time"], int(rpc_head["bits"], 16),
+            rpc_head["nonce"]).hex()
         header = {"hex": head_hex, "height": rpc_head["height"]}
     else:
         header = {"block_height": rpc_head["height"],
@@ -95,6 +135,17 @@ def get_block_header(rpc, blockhash, raw=False):
                 "bits": int(rpc_head["bits"], 16)}
     return header
 
+def get_block_header(rpc, blockhash, raw=False):
+    #copy so that callers can't modify the cached header
+    return dict(_get_block_header_cached(rpc, blockhash, raw))
+
+#a merkle proof of a tx never changes for a given blockhash, and Electrum
+# asks for the proofs of all its wallet txes every time it connects
+@functools.lru_cache(maxsize=4096)
+def get_electrum_merkle_proof(rpc, txid, blockhash):
+    core_proof = rpc.call("gettxoutproof", [[txid], blockhash])
+    return convert_core_to_electrum_merkle_proof(core_proof)
+
 def get_current_header(rpc, raw):
     bestblockhash = rpc.call("getbestblockhash", [])
     header = get_block_header(rpc, bestblockhash, raw)
@@ -102,27 +153,34 @@ def get_current_header(rpc, raw):
 
 def get_block_headers_hex(rpc, start_height, count):
     #read count number of headers starting from start_height
-    result = bytearray()
+    if not isinstance(start_height, int) or not isinstance(count, int):
+        #these come straight from the client
+        return "", 0
+    tip_height = rpc.call("getblockcount", [])
+    count = min(count, tip_height - start_height + 1)
+    if start_height < 0 or count <= 0:
+        return "", 0
+    heights = range(start_height, start_height + count)
+    blockhashes = {}
+    for h in heights:
+        blockhash = block_hash_cache.pop(h, None)
+        if blockhash is not None:
+            #reinsert at the end to mark it as recently used
+            block_hash_cache[h] = blockhash
+            blockhashes[h] = blockhash
+    uncached_heights = [h for h in heights if h not in blockhashes]
     try:
-        the_hash = rpc.call("getblockhash", [start_height])
+        blockhashes.update(zip(uncached_heights, rpc.batch_call(
+            [("getblockhash", [h]) for h in uncached_heights])))
+        #verbose=False makes the node return the serialized header hex
+        headers = rpc.batch_call([("getblockheader", [blockhashes[h], False])
+            for h in heights])
     except JsonRpcError as e:
+        #the chain tip can move backwards between calls if there's a reorg
         return "", 0
-    for i in range(count):
-        header = rpc.call("getblockheader", [the_hash])
-        #add header hex to result
-        if "previousblockhash" in header:
-            prevblockhash = header["previousblockhash"]
-        else:
-            prevblockhash = "00"*32 #genesis block
-        h1 = struct.pack("<i32s32sIII", header["version"],
-            binascii.unhexlify(prevblockhash)[::-1],
-            binascii.unhexlify(header["merkleroot"])[::-1],
-            header["time"], int(header["bits"], 16), header["nonce"])
-        result.extend(h1)
-        if "nextblockhash" not in header:
-            break
-        the_hash = header["nextblockhash"]
-    return binascii.hexlify(result).decode("utf-8"), len(result)//80
+    for h in uncached_heights:
+        cache_block_hash(h, blockhashes[h], tip_height - h + 1)
+    return "".join(headers), len(headers)
 
 class ElectrumProtocol(object):
     """
@@ -146,6 +204,36 @@ class ElectrumProtocol(object):
         self.subscribed_to_headers = False
         self.are_headers_raw = False
         self.txid_blockhash_map = {}
+        self.cached_banner = None
+        self.cached_banner_time = 0
+        self.method_handlers = {
+            "blockchain.transaction.get": self._handle_transaction_get,
+            "blockchain.transaction.get_merkle":
+                self._handle_transaction_get_merkle,
+            "blockchain.scripthash.subscribe":
+                self._handle_scripthash_subscribe,
+            "blockchain.scripthash.get_history":
+                self._handle_scripthash_get_history,
+            "blockchain.scripthash.get_balance":
+                self._handle_scripthash_get_balance,
+            "server.ping": self._handle_server_ping,
+            "blockchain.headers.subscribe": self._handle_headers_subscribe,
+            "blockchain.block.get_header": self._handle_block_get_header,
+            "blockchain.block.header": self._handle_block_header,
+            "blockchain.block.headers": self._handle_block_headers,
+            "blockchain.block.get_chunk": self._handle_block_get_chunk,
+            "blockchain.transaction.broadcast":
+                self._handle_transaction_broadcast,
+            "mempool.get_fee_histogram": self._handle_mempool_get_fee_histogram,
+            "blockchain.estimatefee": self._handle_estimatefee,
+            "blockchain.relayfee": self._handle_relayfee,
+            "server.banner": self._handle_server_banner,
+            "server.donation_address": self._handle_server_donation_address,
+            "server.version": self._handle_server_version,
+            "server.peers.subscribe": self._handle_server_peers_subscribe,
+            "blockchain.transaction.id_from_pos":
+                self._handle_transaction_id_from_pos,
+        }
 
     def set_send_reply_fun(self, send_reply_fun):
         self.send_reply_fun = send_reply_fun
@@ -184,303 +272,328 @@ class ElectrumProtocol(object):
             raise IOError("Bad client query, no \"method\"")
         method = query["method"]
 
-        if method == "blockchain.transaction.get":
-            txid = query["params"][0]
-            tx = None
-            try:
-                tx = self.rpc.call("gettransaction", [txid])["hex"]
-            except JsonRpcError:
-                if txid in self.txid_blockhash_map:
-                    tx = self.rpc.call("getrawtransaction", [txid, False,
-                        self.txid_blockhash_map[txid]])
-            if tx is not None:
-                self._send_response(query, tx)
-            else:
-                self._send_error(query["id"], {"message": "txid not found"})
-        elif method == "blockchain.transaction.get_merkle":
-            txid = query["params"][0]
+        handler = self.method_handlers.get(method)
+        if handler is None:
+            self.logger.error("*** BUG! Not handling method: " + method
+                + " query=" + str(query))
+            return
+        handler(query)
+
+    def _handle_transaction_get(self, query):
+        txid = query["params"][0]
+        tx = None
+        try:
+            tx = self.rpc.call("gettransaction", [txid])["hex"]
+        except JsonRpcError:
+            if txid in self.txid_blockhash_map:
+                tx = self.rpc.call("getrawtransaction", [txid, False,
+                    self.txid_blockhash_map[txid]])
+        if tx is not None:
+            self._send_response(query, tx)
+        else:
+            self._send_error(query["id"], {"message": "txid not found"})
+
+    def _handle_transaction_get_merkle(self, query):
+        txid = query["params"][0]
+        try:
+            tx = self.rpc.call("gettransaction", [txid])
+            txheader = get_block_header(self.rpc, tx["blockhash"], False)
+        except JsonRpcError as e:
+            self._send_error(query["id"], {"message": "txid not found"})
+        else:
             try:
-                tx = self.rpc.call("gettransaction", [txid])
-                txheader = get_block_header(self.rpc, tx["blockhash"], False)
-            except JsonRpcError as e:
-                self._send_error(query["id"], {"message": "txid not found"})
-            else:
-                try:
-                    core_proof = self.rpc.call("gettxoutproof", [[txid],
-                        tx["blockhash"]])
-                    electrum_proof = \
-                        convert_core_to_electrum_merkle_proof(core_proof)
-                    implied_merkle_root = hash_merkle_root(
-                        electrum_proof["merkle"], txid, electrum_proof["pos"])
-                    if implied_merkle_root != electrum_proof["merkleroot"]:
-                        raise ValueError
-                    reply = {"block_height": txheader["block_height"], "pos":
-                        electrum_proof["pos"], "merkle":
-                        electrum_proof["merkle"]}
-                except (ValueError, JsonRpcError) as e:
-                    self.logger.info("merkle proof not found for " + txid
-                        + " sending a dummy, Electrum client should be run "
-                        + "with --skipmerklecheck")
-                    #reply with a proof that the client with accept if
-                    # its configured to not check the merkle proof
-                    reply = {"block_height": txheader["block_height"], "pos": 0,
-                        "merkle": [txid]}
-                self._send_response(query, reply)
-        elif method == "blockchain.scripthash.subscribe":
-            scrhash = query["params"][0]
-            if self.txmonitor.subscribe_address(scrhash):
-                history_hash = self.txmonitor.get_electrum_history_hash(scrhash)
+                electrum_proof = get_electrum_merkle_proof(self.rpc, txid,
+                    tx["blockhash"])
+                implied_merkle_root = hash_merkle_root(
+                    electrum_proof["merkle"], txid, electrum_proof["pos"])
+                if implied_merkle_root != electrum_proof["merkleroot"]:
+                    raise ValueError
+                reply = {"block_height": txheader["block_height"], "pos":
+                    electrum_proof["pos"], "merkle":
+                    electrum_proof["merkle"]}
+            except (ValueError, JsonRpcError) as e:
+                self.logger.info("merkle proof not found for " + txid
+                    + " sending a dummy, Electrum client should be run "
+                    + "with --skipmerklecheck")
+                #reply with a proof that the client with accept if
+                # its configured to not check the merkle proof
+                reply = {"block_height": txheader["block_height"], "pos": 0,
+                    "merkle": [txid]}
+            self._send_response(query, reply)
+
+    def _handle_scripthash_subscribe(self, query):
+        scrhash = query["params"][0]
+        if self.txmonitor.subscribe_address(scrhash):
+            history_hash = self.txmonitor.get_electrum_history_hash(scrhash)
+        else:
+            self.logger.warning("Address not known to server, hash(address)"
+                + " = " + scrhash + ".\nCheck that you've imported the "
+                + "master public key(s) correctly. The first three "
+                + "addresses of each key are printed out on startup,\nso "
+                + "check that they really are addresses you expect. In "
+                + "Electrum go to Wallet -> Information to get the right "
+                + "master public key.")
+            raise UnknownScripthashError(scrhash)
+        self._send_response(query, history_hash)
+
+    def _handle_scripthash_get_history(self, query):
+        scrhash = query["params"][0]
+        history = self.txmonitor.get_electrum_history(scrhash)
+        if history == None:
+            self.logger.warning("Address history not known to server, "
+                + "hash(address) = " + scrhash)
+            raise UnknownScripthashError(scrhash)
+        self._send_response(query, history)
+
+    def _handle_scripthash_get_balance(self, query):
+        scrhash = query["params"][0]
+        balance = self.txmonitor.get_address_balance(scrhash)
+        if balance == None:
+            self.logger.warning("Address history not known to server, "
+                + "hash(address) = " + scrhash)
+            raise UnknownScripthashError(scrhash)
+        self._send_response(query, balance)
+
+    def _handle_server_ping(self, query):
+        self._send_response(query, None)
+
+    def _handle_headers_subscribe(self, query):
+        if self.protocol_version in (1.2, 1.3):
+            if len(query["params"]) > 0:
+                self.are_headers_raw = query["params"][0]
             else:
-                self.logger.warning("Address not known to server, hash(address)"
-                    + " = " + scrhash + ".\nCheck that you've imported the "
-                    + "master public key(s) correctly. The first three "
-                    + "addresses of each key are printed out on startup,\nso "
-                    + "check that they really are addresses you expect. In "
-                    + "Electrum go to Wallet -> Information to get the right "
-                    + "master public key.")
-                raise UnknownScripthashError(scrhash)
-            self._send_response(query, history_hash)
-        elif method == "blockchain.scripthash.get_history":
-            scrhash = query["params"][0]
-            history = self.txmonitor.get_electrum_history(scrhash)
-            if history == None:
-                self.logger.warning("Address history not known to server, "
-                    + "hash(address) = " + scrhash)
-                raise UnknownScripthashError(scrhash)
-            self._send_response(query, history)
-        elif method == "blockchain.scripthash.get_balance":
-            scrhash = query["params"][0]
-            balance = self.txmonitor.get_address_balance(scrhash)
-            if balance == None:
-                self.logger.warning("Address history not known to server, "
-                    + "hash(address) = " + scrhash)
-                raise UnknownScripthashError(scrhash)
-            self._send_response(query, balance)
-        elif method == "server.ping":
-            self._send_response(query, None)
-        elif method == "blockchain.headers.subscribe":
-            if self.protocol_version in (1.2, 1.3):
-                if len(query["params"]) > 0:
-                    self.are_headers_raw = query["params"][0]
-                else:
-                    self.are_headers_raw = (False if self.protocol_version ==
-                        1.2 else True)
-            elif self.protocol_version == 1.4:
-                self.are_headers_raw = True
-            self.logger.debug("are_headers_raw = " + str(self.are_headers_raw))
-            self.subscribed_to_headers = True
-            new_bestblockhash, header = get_current_header(self.rpc,
-                self.are_headers_raw)
+                self.are_headers_raw = (False if self.protocol_version ==
+                    1.2 else True)
+        elif self.protocol_version == 1.4:
+            self.are_headers_raw = True
+        self.logger.debug("are_headers_raw = " + str(self.are_headers_raw))
+        self.subscribed_to_headers = True
+        new_bestblockhash, header = get_current_header(self.rpc,
+            self.are_headers_raw)
+        self._send_response(query, header)
+
+    def _handle_block_get_header(self, query):
+        height = query["params"][0]
+        try:
+            blockhash = get_block_hash(self.rpc, height)
+            #this deprecated method (as of 1.3) can only
+            # return non-raw headers
+            header = get_block_header(self.rpc, blockhash, False)
             self._send_response(query, header)
-        elif method == "blockchain.block.get_header":
-            height = query["params"][0]
-            try:
-                blockhash = self.rpc.call("getblockhash", [height])
-                #this deprecated method (as of 1.3) can only
-                # return non-raw headers
-                header = get_block_header(self.rpc, blockhash, False)
-                self._send_response(query, header)
-            except JsonRpcError:
-                error = {"message": "height " + str(height) + " out of range",
-                    "code": -1}
-                self._send_error(query["id"], error)
-        elif method == "blockchain.block.header":
-            height = query["params"][0]
-            try:
-                blockhash = self.rpc.call("getblockhash", [height])
-                header = get_block_header(self.rpc, blockhash, True)
-                self._send_response(query, header["hex"])
-            except JsonRpcError:
-                error = {"message": "height " + str(height) + " out of range",
-                    "code": -1}
-                self._send_error(query["id"], error)
-        elif method == "blockchain.block.headers":
-            MAX_CHUNK_SIZE = 2016
-            start_height = query["params"][0]
-            count = query["params"][1]
-            count = min(count, MAX_CHUNK_SIZE)
-            headers_hex, n = get_block_headers_hex(self.rpc, start_height,
-                count)
-            self._send_response(query, {'hex': headers_hex, 'count': n, 'max':
-                MAX_CHUNK_SIZE})
-        elif method == "blockchain.block.get_chunk":
-            RETARGET_INTERVAL = 2016
-            index = query["params"][0]
-            tip_height = self.rpc.call("getblockchaininfo", [])["headers"]
-            #logic copied from electrumx get_chunk() in controller.py
-            next_height = tip_height + 1
-            start_height = min(index*RETARGET_INTERVAL, next_height)
-            count = min(next_height - start_height, RETARGET_INTERVAL)
-            headers_hex, n = get_block_headers_hex(self.rpc, start_height,
-                count)
-            self._send_response(query, headers_hex)
-        elif method == "blockchain.transaction.broadcast":
-            txhex = query["params"][0]
-            result = None
-            error = None
-            txreport = self.rpc.call("testmempoolaccept", [[txhex]])[0]
-            if not txreport["allowed"]:
-                error = txreport["reject-reason"]
-            else:
-                result = txreport["txid"]
-                broadcast_method = self.broadcast_method
-                self.logger.info('Broadcasting tx ' + txreport["txid"]
-                    + " with broadcast method: " + broadcast_method)
-                if broadcast_method == "tor-or-own-node":
-                    tor_hostport = get_tor_hostport()
-                    if tor_hostport is not None:
-                        self.logger.info("Tor detected at " + str(tor_hostport)
-                            + ". Broadcasting through tor.")
-                        broadcast_method = "tor"
-                        self.tor_hostport = tor_hostport
-                    else:
-                        self.logger.info("Could not detect tor. Broadcasting "
-                            + "through own node.")
-                        broadcast_method = "own-node"
-                if broadcast_method == "own-node":
-                    if not self.rpc.call("getnetworkinfo", [])["localrelay"]:
-                        error = "Broadcast disabled when using blocksonly"
-                        result = None
-                        self.logger.warning("Transaction broadcasting disabled"
-                            + " when blocksonly")
-                    else:
-                        try:
-                            self.rpc.call("sendrawtransaction", [txhex])
-                        except JsonRpcError as e:
-                            self.logger.error("Error broadcasting: " + repr(e))
-                elif broadcast_method == "tor":
-                    network = "mainnet"
-                    chaininfo = self.rpc.call("getblockchaininfo", [])
-                    if chaininfo["chain"] == "test":
-                        network = "testnet"
-                    elif chaininfo["chain"] == "regtest":
-                        network = "regtest"
-                    self.logger.debug("broadcasting to network: " + network)
-                    success = tor_broadcast_tx(txhex, self.tor_hostport,
-                        network, self.rpc, self.logger)
-                    if not success:
-                        result = None
-                elif broadcast_method.startswith("system "):
-                    with tempfile.NamedTemporaryFile() as fd:
-                        system_line = broadcast_method[7:].replace("%s",
-                            fd.name)
-                        fd.write(txhex.encode())
-                        fd.flush()
-                        self.logger.debug("running command: " + system_line)
-                        os.system(system_line)
+        except JsonRpcError:
+            error = {"message": "height " + str(height) + " out of range",
+                "code": -1}
+            self._send_error(query["id"], error)
+
+    def _handle_block_header(self, query):
+        height = query["params"][0]
+        try:
+            blockhash = get_block_hash(self.rpc, height)
+            header = get_block_header(self.rpc, blockhash, True)
+            self._send_response(query, header["hex"])
+        except JsonRpcError:
+            error = {"message": "height " + str(height) + " out of range",
+                "code": -1}
+            self._send_error(query["id"], error)
+
+    def _handle_block_headers(self, query):
+        MAX_CHUNK_SIZE = 2016
+        start_height = query["params"][0]
+        count = query["params"][1]
+        count = min(count, MAX_CHUNK_SIZE)
+        headers_hex, n = get_block_headers_hex(self.rpc, start_height,
+            count)
+        self._send_response(query, {'hex': headers_hex, 'count': n, 'max':
+            MAX_CHUNK_SIZE})
+
+    def _handle_block_get_chunk(self, query):
+        RETARGET_INTERVAL = 2016
+        index = query["params"][0]
+        tip_height = self.rpc.call("getblockchaininfo", [])["headers"]
+        #logic copied from electrumx get_chunk() in controller.py
+        next_height = tip_height + 1
+        start_height = min(index*RETARGET_INTERVAL, next_height)
+        count = min(next_height - start_height, RETARGET_INTERVAL)
+        headers_hex, n = get_block_headers_hex(self.rpc, start_height,
+            count)
+        self._send_response(query, headers_hex)
+
+    def _handle_transaction_broadcast(self, query):
+        txhex = query["params"][0]
+        result = None
+        error = None
+        txreport = self.rpc.call("testmempoolaccept", [[txhex]])[0]
+        if not txreport["allowed"]:
+            error = txreport["reject-reason"]
+        else:
+            result = txreport["txid"]
+            broadcast_method = self.broadcast_method
+            self.logger.info('Broadcasting tx ' + txreport["txid"]
+                + " with broadcast method: " + broadcast_method)
+            if broadcast_method == "tor-or-own-node":
+                tor_hostport = get_tor_hostport()
+                if tor_hostport is not None:
+                    self.logger.info("Tor detected at " + str(tor_hostport)
+                        + ". Broadcasting through tor.")
+                    broadcast_method = "tor"
+                    self.tor_hostport = tor_hostport
+                else:
+                    self.logger.info("Could not detect tor. Broadcasting "
+                        + "through own node.")
+                    broadcast_method = "own-node"
+            if broadcast_method == "own-node":
+                if not self.rpc.call("getnetworkinfo", [])["localrelay"]:
+                    error = "Broadcast disabled when using blocksonly"
+                    result = None
+                    self.logger.warning("Transaction broadcasting disabled"
+                        + " when blocksonly")
                 else:
-                    self.logger.error("Unrecognized broadcast method = "
-                        + broadcast_method)
+                    try:
+                        self.rpc.call("sendrawtransaction", [txhex])
+                    except JsonRpcError as e:
+                        self.logger.error("Error broadcasting: " + repr(e))
+            elif broadcast_method == "tor":
+                network = "mainnet"
+                chaininfo = self.rpc.call("getblockchaininfo", [])
+                if chaininfo["chain"] == "test":
+                    network = "testnet"
+                elif chaininfo["chain"] == "regtest":
+                    network = "regtest"
+                self.logger.debug("broadcasting to network: " + network)
+                success = tor_broadcast_tx(txhex, self.tor_hostport,
+                    network, self.rpc, self.logger)
+                if not success:
                     result = None
-                    error = "Unrecognized broadcast method"
-            if result != None:
-                self._send_response(query, result)
+            elif broadcast_method.startswith("system "):
+                with tempfile.NamedTemporaryFile() as fd:
+                    system_line = broadcast_method[7:].replace("%s",
+                        fd.name)
+                    fd.write(txhex.encode())
+                    fd.flush()
+                    self.logger.debug("running command: " + system_line)
+                    os.system(system_line)
             else:
-                self._send_error(query["id"], error)
-        elif method == "mempool.get_fee_histogram":
-            result = self.mempool_sync.get_fee_histogram()
-            self.logger.debug("mempool entry count = "
-                + str(len(self.mempool_sync.mempool)))
+                self.logger.error("Unrecognized broadcast method = "
+                    + broadcast_method)
+                result = None
+                error = "Unrecognized broadcast method"
+        if result != None:
             self._send_response(query, result)
-        elif method == "blockchain.estimatefee":
-            feerate = 0.0001
-            try:
-                estimate = self.rpc.call("estimatesmartfee", [query["params"][0]])
-                if "feerate" in estimate:
-                    feerate = estimate["feerate"]
-            except JsonRpcError as e:
-                self.logger.debug(
-                    "sending 1sat/vb, unable to get fee estimate from node: "
-                    + repr(e))
-            self._send_response(query, feerate)
-        elif method == "blockchain.relayfee":
-            networkinfo = self.rpc.call("getnetworkinfo", [])
-            self._send_response(query, networkinfo["relayfee"])
-        elif method == "server.banner":
-            networkinfo = self.rpc.call("getnetworkinfo", [])
-            blockchaininfo = self.rpc.call("getblockchaininfo", [])
-            uptime = self.rpc.call("uptime", [])
-            nettotals = self.rpc.call("getnettotals", [])
-            uptime_days = uptime / 60.0 / 60 / 24
-            first_unpruned_block_text = ""
-            if blockchaininfo["pruned"]:
-                first_unpruned_block_time = self.rpc.call("getblockheader", [
-                    self.rpc.call("getblockhash", [blockchaininfo[
-                    "pruneheight"]])])["time"]
-                first_unpruned_block_text = ("First unpruned block: "
-                    + str(blockchaininfo["pruneheight"]) + " ("
-                    + str(
-                    datetime.datetime.fromtimestamp(first_unpruned_block_time))
-                    + ")\n")
-            self._send_response(query, BANNER.format(
-                serverversion=SERVER_VERSION_NUMBER,
-                detwallets=len(self.txmonitor.deterministic_wallets),
-                addr=len(self.txmonitor.address_history),
-                useragent=networkinfo["subversion"],
-                uptime=str(datetime.timedelta(seconds=uptime)),
-                peers=networkinfo["connections"],
-                recvbytes=bytes_fmt(nettotals["totalbytesrecv"]),
-                recvbytesperday=bytes_fmt(
-                    nettotals["totalbytesrecv"]/uptime_days),
-                sentbytes=bytes_fmt(nettotals["totalbytessent"]),
-                sentbytesperday=bytes_fmt(
-                    nettotals["totalbytessent"]/uptime_days),
-                blocksonly=not networkinfo["localrelay"],
-                pruning=blockchaininfo["pruned"],
-                blockchainsizeondisk=bytes_fmt(
-                    blockchaininfo["size_on_disk"]),
-                firstunprunedblock=first_unpruned_block_text,
-                donationaddr=DONATION_ADDR))
-        elif method == "server.donation_address":
-            self._send_response(query, DONATION_ADDR)
-        elif method == "server.version":
-            if len(query["params"]) > 0:
-                client_protocol_version = query["params"][1]
-                if isinstance(client_protocol_version, list):
-                    client_min, client_max = float(client_min)
-                else:
-                    client_min = float(query["params"][1])
-                    client_max = client_min
+        else:
+            self._send_error(query["id"], error)
+
+    def _handle_mempool_get_fee_histogram(self, query):
+        result = self.mempool_sync.get_fee_histogram()
+        self.logger.debug("mempool entry count = "
+            + str(len(self.mempool_sync.mempool)))
+        self._send_response(query, result)
+
+    def _handle_estimatefee(self, query):
+        feerate = 0.0001
+        try:
+            estimate = self.rpc.call("estimatesmartfee", [query["params"][0]])
+            if "feerate" in estimate:
+                feerate = estimate["feerate"]
+        except JsonRpcError as e:
+            self.logger.debug(
+                "sending 1sat/vb, unable to get fee estimate from node: "
+                + repr(e))
+        self._send_response(query, feerate)
+
+    def _handle_relayfee(self, query):
+        networkinfo = self.rpc.call("getnetworkinfo", [])
+        self._send_response(query, networkinfo["relayfee"])
+
+    def _handle_server_banner(self, query):
+        if (self.cached_banner is not None and time.time()
+                - self.cached_banner_time < BANNER_CACHE_TIME):
+            self._send_response(query, self.cached_banner)
+            return
+        networkinfo, blockchaininfo, uptime, nettotals = self.rpc.batch_call(
+            [("getnetworkinfo", []), ("getblockchaininfo", []),
+            ("uptime", []), ("getnettotals", [])])
+        uptime_days = uptime / 60.0 / 60 / 24
+        first_unpruned_block_text = ""
+        if blockchaininfo["pruned"]:
+            first_unpruned_block_time = self.rpc.call("getblockheader", [
+                get_block_hash(self.rpc, blockchaininfo["pruneheight"])])[
+                "time"]
+            first_unpruned_block_text = ("First unpruned block: "
+                + str(blockchaininfo["pruneheight"]) + " ("
+                + str(
+                datetime.datetime.fromtimestamp(first_unpruned_block_time))
+                + ")\n")
+        self.cached_banner = BANNER.format(
+            serverversion=SERVER_VERSION_NUMBER,
+            detwallets=len(self.txmonitor.deterministic_wallets),
+            addr=len(self.txmonitor.address_history),
+            useragent=networkinfo["subversion"],
+            uptime=str(datetime.timedelta(seconds=uptime)),
+            peers=networkinfo["connections"],
+            recvbytes=bytes_fmt(nettotals["totalbytesrecv"]),
+            recvbytesperday=bytes_fmt(
+                nettotals["totalbytesrecv"]/uptime_days),
+            sentbytes=bytes_fmt(nettotals["totalbytessent"]),
+            sentbytesperday=bytes_fmt(
+                nettotals["totalbytessent"]/uptime_days),
+            blocksonly=not networkinfo["localrelay"],
+            pruning=blockchaininfo["pruned"],
+            blockchainsizeondisk=bytes_fmt(
+                blockchaininfo["size_on_disk"]),
+            firstunprunedblock=first_unpruned_block_text,
+            donationaddr=DONATION_ADDR)
+        self.cached_banner_time = time.time()
+        self._send_response(query, self.cached_banner)
+
+    def _handle_server_donation_address(self, query):
+        self._send_response(query, DONATION_ADDR)
+
+    def _handle_server_version(self, query):
+        if len(query["params"]) > 0:
+            client_protocol_version = query["params"][1]
+            if isinstance(client_protocol_version, list):
+                client_min, client_max = float(client_min)
             else:
-                #it seems some clients like bluewallet dont provide a version
-                #just assume the client is compatible with us then
-                client_min = SERVER_PROTOCOL_VERSION_MIN
-                client_max = SERVER_PROTOCOL_VERSION_MAX
-            self.protocol_version = min(client_max, SERVER_PROTOCOL_VERSION_MAX)
-            if self.protocol_version < max(client_min,
-                    SERVER_PROTOCOL_VERSION_MIN):
-                logging.error("*** Client protocol version " + str(
-                    client_protocol_version) + " not supported, update needed")
-                raise ConnectionRefusedError()
-            self._send_response(query, ["ElectrumPersonalServer "
-                + SERVER_VERSION_NUMBER, str(self.protocol_version)])
-        elif method == "server.peers.subscribe":
-            self._send_response(query, []) #no peers to report
-        elif method == "blockchain.transaction.id_from_pos":
-            height = query["params"][0]
-            tx_pos = query["params"][1]
-            merkle = False
-            if len(query["params"]) > 2:
-                merkle = query["params"][2]
-            try:
-                blockhash = self.rpc.call("getblockhash", [height])
-                block = self.rpc.call("getblock", [blockhash, 1])
-                txid = block["tx"][tx_pos]
-                self.txid_blockhash_map[txid] = blockhash
-                if not merkle:
-                    result = txid
-                else:
-                    core_proof = self.rpc.call("gettxoutproof", [[txid],
-                        blockhash])
-                    electrum_proof =\
-                        convert_core_to_electrum_merkle_proof(core_proof)
-                    result = {"tx_hash": txid, "merkle": electrum_proof[
-                        "merkle"]}
-                self._send_response(query, result)
-            except JsonRpcError as e:
-                error = {"message": repr(e)}
-                self._send_error(query["id"], error)
+                client_min = float(query["params"][1])
+                client_max = client_min
         else:
-            self.logger.error("*** BUG! Not handling method: " + method
-                + " query=" + str(query))
+            #it seems some clients like bluewallet dont provide a version
+            #just assume the client is compatible with us then
+            client_min = SERVER_PROTOCOL_VERSION_MIN
+            client_max = SERVER_PROTOCOL_VERSION_MAX
+        self.protocol_version = min(client_max, SERVER_PROTOCOL_VERSION_MAX)
+        if self.protocol_version < max(client_min,
+                SERVER_PROTOCOL_VERSION_MIN):
+            self.logger.error("*** Client protocol version " + str(
+                client_protocol_version) + " not supported, update needed")
+            raise ConnectionRefusedError()
+        self._send_response(query, ["ElectrumPersonalServer "
+            + SERVER_VERSION_NUMBER, str(self.protocol_version)])
+
+    def _handle_server_peers_subscribe(self, query):
+        self._send_response(query, []) #no peers to report
+
+    def _handle_transaction_id_from_pos(self, query):
+        height = query["params"][0]
+        tx_pos = query["params"][1]
+        merkle = False
+        if len(query["params"]) > 2:
+            merkle = query["params"][2]
+        try:
+            blockhash = get_block_hash(self.rpc, height)
+            block = self.rpc.call("getblock", [blockhash, 1])
+            cache_block_hash(height, blockhash, block["confirmations"])
+            txid = block["tx"][tx_pos]
+            self.txid_blockhash_map[txid] = blockhash
+            if not merkle:
+                result = txid
+            else:
+                electrum_proof = get_electrum_merkle_proof(self.rpc, txid,
+                    blockhash)
+                result = {"tx_hash": txid, "merkle": electrum_proof[
+                    "merkle"]}
+            self._send_response(query, result)
+        except JsonRpcError as e:
+            error = {"message": repr(e)}
+            self._send_error(query["id"], error)
 
@@ -53,11 +53,15 @@ def Hash(x):
     return out
 
 def hash_merkle_root(merkle_s, target_hash, pos):
+    #same as calling Hash() on each level but without its type conversions
+    sha = hashlib.sha256
     h = hash_decode(target_hash)
-    for i in range(len(merkle_s)):
-        item = merkle_s[i]
-        h = Hash(hash_decode(item) + h) if ((pos >> i) & 1) else Hash(
-            h + hash_decode(item))
+    for item in merkle_s:
+        if pos & 1:
+            h = sha(sha(hash_decode(item) + h).digest()).digest()
+        else:
+            h = sha(sha(h + hash_decode(item)).digest()).digest()
+        pos >>= 1
     return hash_encode(h)
 
 def hash_160(public_key):
@@ -75,9 +79,19 @@ def hash_160(public_key):
 def script_to_address(scriptPubKey, rpc):
     return rpc.call("decodescript", [scriptPubKey])["address"]
 
+def scripts_to_addresses(scriptPubKeys, rpc):
+    """Same as script_to_address() but uses one batched RPC for all scripts"""
+    return [d["address"] for d in rpc.batch_call([("decodescript", [spk])
+        for spk in scriptPubKeys])]
+
 def address_to_script(addr, rpc):
     return rpc.call("validateaddress", [addr])["scriptPubKey"]
 
+def addresses_to_scripts(addrs, rpc):
+    """Same as address_to_script() but uses one batched RPC for all addrs"""
+    return [v["scriptPubKey"] for v in rpc.batch_call([("validateaddress",
+        [addr]) for addr in addrs])]
+
 def address_to_scripthash(addr, rpc):
     return script_to_scripthash(address_to_script(addr, rpc))
 
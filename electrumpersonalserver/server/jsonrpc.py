@@ -6,6 +6,11 @@
 import base64
 import http.client
 import json
+import threading
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 class JsonRpcError(Exception): pass
 class JsonRpcConnectionError(JsonRpcError): pass
@@ -26,16 +31,44 @@ class JsonRpc(object):
         else:
             self.create_authstr(user, password)
 
-        self.conn = http.client.HTTPConnection(self.host, self.port)
+        #each thread gets its own connection, which is kept open and reused
+        # for all the calls made from that thread
+        self.thread_local = threading.local()
         if len(wallet_filename) > 0:
             self.url = "/wallet/" + wallet_filename
         else:
             self.url = ""
         self.logger = logger
         self.queryId = 1
+        self.query_id_lock = threading.Lock()
+
+    @property
+    def conn(self):
+        conn = getattr(self.thread_local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port)
+            self.thread_local.conn = conn
+        return conn
+
+    @conn.setter
+    def conn(self, conn):
+        self.thread_local.conn = conn
+
+    def get_query_id(self):
+        with self.query_id_lock:
+            query_id = self.queryId
+            self.queryId += 1
+        return query_id
 
     def create_authstr(self, username, password):
         self.authstr = "%s:%s" % (username, password)
+        #the headers are the same for every request so build them once
+        self.headers = {"User-Agent": "electrum-personal-server",
+                        "Content-Type": "application/json",
+                        "Accept": "application/json",
+                        "Connection": "keep-alive",
+                        "Authorization": b"Basic " + base64.b64encode(
+                            self.authstr.encode('utf-8'))}
 
     def load_from_cookie(self):
         fd = open(self.cookie_path)
@@ -50,16 +83,14 @@ class JsonRpc(object):
         the resulting JSON object is returned.  In case of an error
         with the connection (not JSON-RPC itself), an exception is raised.
         """
-        headers = {"User-Agent": "electrum-personal-server",
-                   "Content-Type": "application/json",
-                   "Accept": "application/json"}
-        headers["Authorization"] = (b"Basic " +
-            base64.b64encode(self.authstr.encode('utf-8')))
-        body = json.dumps(obj)
+        if orjson is not None:
+            body = orjson.dumps(obj)
+        else:
+            body = json.dumps(obj)
         auth_failed_once = False
         for i in range(20):
             try:
-                self.conn.request("POST", self.url, body, headers)
+                self.conn.request("POST", self.url, body, self.headers)
                 response = self.conn.getresponse()
                 if response.status == 401:
                     if self.cookie_path == None or auth_failed_once:
@@ -77,6 +108,8 @@ class JsonRpc(object):
                     self.conn.close()
                     raise JsonRpcConnectionError("unknown error in JSON-RPC")
                 data = response.read()
+                if orjson is not None:
+                    return orjson.loads(data)
                 return json.loads(data.decode('utf-8'))
             except JsonRpcConnectionError as exc:
                 raise exc
@@ -97,27 +130,55 @@ class JsonRpc(object):
             break
         return None
 
-    def call(self, method, params):
-        currentId = self.queryId
-        self.queryId += 1
-
-        request = {"method": method, "params": params, "id": currentId}
+    def _query_with_reconnect(self, request):
         #query can fail from keepalive timeout; keep retrying if it does, up
         #to a reasonable limit, then raise (failure to access blockchain
         #is a critical failure). Note that a real failure to connect (e.g.
         #wrong port) is raised in queryHTTP directly.
-        response_received = False
         for i in range(100):
             response = self.queryHTTP(request)
             if response != "CONNFAILURE":
-                response_received = True
-                break
+                return response
             #Failure means keepalive timed out, just make a new one
             self.conn = http.client.HTTPConnection(self.host, self.port)
-        if not response_received:
-            raise JsonRpcConnectionError("Unable to connect over RPC")
+        raise JsonRpcConnectionError("Unable to connect over RPC")
+
+    def call(self, method, params):
+        currentId = self.get_query_id()
+
+        request = {"method": method, "params": params, "id": currentId}
+        response = self._query_with_reconnect(request)
         if response["id"] != currentId:
             raise JsonRpcConnectionError("invalid id returned by query")
         if response["error"] is not None:
             raise JsonRpcError(response["error"])
         return response["result"]
+
+    def batch_call(self, calls):
+        """
+        Send many calls in a single JSON-RPC batch request, which saves one
+        HTTP round-trip per call. calls is a list of (method, params) tuples,
+        the results are returned in the same order. If any of the calls
+        fails then JsonRpcError is raised.
+        """
+        if len(calls) == 0:
+            return []
+        request = []
+        for method, params in calls:
+            request.append({"method": method, "params": params, "id":
+                self.get_query_id()})
+        response = self._query_with_reconnect(request)
+        if not isinstance(response, list):
+            if isinstance(response, dict) and response.get("error"):
+                raise JsonRpcError(response["error"])
+            raise JsonRpcConnectionError("invalid response to batch query")
+        responses_by_id = {r["id"]: r for r in response}
+        results = []
+        for req in request:
+            if req["id"] not in responses_by_id:
+                raise JsonRpcConnectionError("invalid id returned by query")
+            r = responses_by_id[req["id"]]
+            if r["error"] is not None:
+                raise JsonRpcError(r["error"])
+            results.append(r["result"])
+        return results
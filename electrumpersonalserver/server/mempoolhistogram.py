@@ -6,13 +6,11 @@ from enum import Enum
 
 from electrumpersonalserver.server.jsonrpc import JsonRpcError
 
-def calc_histogram(mempool):
+def calc_histogram(fee_hist):
+    """fee_hist maps each fee rate to the total size of txes paying it"""
     #algorithm copied from the relevant place in ElectrumX
     #https://github.com/kyuupichan/electrumx/blob/e92c9bd4861c1e35989ad2773d33e01219d33280/server/mempool.py
-    fee_hist = defaultdict(int)
-    for fee_rate, size in mempool.values():
-        fee_hist[fee_rate] += size
-    l = list(reversed(sorted(fee_hist.items())))
+    l = sorted(fee_hist.items(), reverse=True)
     out = []
     size = 0
     r = 0
@@ -37,6 +35,9 @@ class MempoolSync(object):
         self.disabled = disabled
         self.polling_interval = polling_interval
         self.mempool = dict()
+        #total size of mempool txes at each fee rate, kept up to date as txes
+        # are added and removed so the histogram doesnt need a full pass
+        self.fee_hist = defaultdict(int)
         self.cached_fee_histogram = [[0, 0]]
         self.added_txids = None
         self.last_poll = None
@@ -86,7 +87,10 @@ class MempoolSync(object):
                 set(self.mempool.keys())))
 
             for txid in removed_txids:
-                del self.mempool[txid]
+                fee_rate, size = self.mempool.pop(txid)
+                self.fee_hist[fee_rate] -= size
+                if self.fee_hist[fee_rate] == 0:
+                    del self.fee_hist[fee_rate]
 
             self.state = "getfeerates"
         elif self.state == "getfeerates":
@@ -98,7 +102,7 @@ class MempoolSync(object):
                 try:
                     txid = next(self.added_txids)
                 except StopIteration:
-                    self.cached_fee_histogram = calc_histogram(self.mempool)
+                    self.cached_fee_histogram = calc_histogram(self.fee_hist)
                     self.state = "waiting"
                     poll_interval_change = \
                         PollIntervalChange.NORMAL_POLLING
@@ -110,5 +114,6 @@ class MempoolSync(object):
                     continue
                 fee_rate = 1e8*mempool_tx["fees"]["base"] // mempool_tx["vsize"]
                 self.mempool[txid] = (fee_rate, mempool_tx["vsize"])
+                self.fee_hist[fee_rate] += mempool_tx["vsize"]
 
         return poll_interval_change
@@ -9,6 +9,9 @@ setup(
     include_package_data=True,
     packages=find_packages(exclude=["tests"]),
     tests_require=["pytest"],
+    extras_require={
+        "orjson": ["orjson"],
+    },
     entry_points={
         "console_scripts": [
             "electrum-personal-server = electrumpersonalserver.server.common:main",
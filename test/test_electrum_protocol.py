@@ -2,6 +2,7 @@
 import pytest
 import logging
 import json
+import struct
 
 from electrumpersonalserver.server import (
     TransactionMonitor,
@@ -11,7 +12,15 @@ from electrumpersonalserver.server import (
     get_current_header,
     get_block_headers_hex,
     JsonRpcError,
-    get_status_electrum
+    get_status_electrum,
+    hash_merkle_root
+)
+import electrumpersonalserver.server.electrumprotocol as electrumprotocol
+from electrumpersonalserver.server.electrumprotocol import (
+    cache_block_hash,
+    get_electrum_merkle_proof,
+    get_block_hash,
+    block_hash_cache
 )
 
 logger = logging.getLogger('ELECTRUMPERSONALSERVER-TEST')
@@ -19,6 +28,13 @@ logger.setLevel(logging.DEBUG)
 
 DUMMY_JSONRPC_BLOCKCHAIN_HEIGHT = 100000
 
+#txcount 1, pos 0, coinbase tx in an empty block, tree with height 1
+COINBASE_ONLY_TXOUTPROOF = (
+    "010000000508085c47cc849eb80ea905cc7800a3be674ffc57263cf210c59d8d0000000"
+    + "0112ba175a1e04b14ba9e7ea5f76ab640affeef5ec98173ac9799a852fa39add320cd66"
+    + "49ffff001d1e2de5650100000001112ba175a1e04b14ba9e7ea5f76ab640affeef5ec98"
+    + "173ac9799a852fa39add30101")
+
 def get_dummy_hash_from_height(height):
     if height == 0:
         return "00"*32
@@ -41,14 +57,20 @@ class DummyJsonRpc(object):
         self.calls[method][1].append(params)
         if method == "getbestblockhash":
             return get_dummy_hash_from_height(self.blockchain_height)
+        elif method == "getblockcount":
+            return self.blockchain_height
         elif method == "getblockhash":
             height = params[0]
-            if height > self.blockchain_height:
+            if not isinstance(height, int) or height > self.blockchain_height:
                 raise JsonRpcError()
             return get_dummy_hash_from_height(height)
         elif method == "getblockheader":
             blockhash = params[0]
             height = get_height_from_dummy_hash(blockhash)
+            if len(params) > 1 and not params[1]:
+                #verbose=False returns the serialized header
+                return struct.pack("<i32s32sIII", 536870912, b"\x00"*32,
+                    b"\xaa"*32, height*100, 0x207fffff, 1).hex()
             header = {
                 "hash": blockhash,
                 "confirmations": self.blockchain_height - height + 1,
@@ -77,6 +99,18 @@ class DummyJsonRpc(object):
             if height < self.blockchain_height:
                 header["nextblockhash"] = get_dummy_hash_from_height(height + 1)
             return header
+        elif method == "getnetworkinfo":
+            return {"subversion": "/Satoshi:23.0.0/", "connections": 8,
+                "localrelay": True, "relayfee": 0.00001}
+        elif method == "getblockchaininfo":
+            return {"chain": "regtest", "headers": self.blockchain_height,
+                "pruned": False, "size_on_disk": 123456789}
+        elif method == "uptime":
+            return 3600
+        elif method == "getnettotals":
+            return {"totalbytesrecv": 1000000, "totalbytessent": 2000000}
+        elif method == "gettxoutproof":
+            return COINBASE_ONLY_TXOUTPROOF
         elif method == "gettransaction":
             for t in self.txlist:
                 if t["txid"] == params[0]:
@@ -85,6 +119,9 @@ class DummyJsonRpc(object):
         else:
             raise ValueError("unknown method in dummy jsonrpc")
 
+    def batch_call(self, calls):
+        return [self.call(method, params) for method, params in calls]
+
 def test_get_block_header():
     rpc = DummyJsonRpc()
     for height in [0, 1000]:
@@ -100,6 +137,24 @@ def test_get_block_header():
                 assert type(ret) == dict
                 assert len(ret) == 7
 
+def test_get_block_header_cached():
+    rpc = DummyJsonRpc()
+    blockhash = rpc.call("getblockhash", [500])
+    first = get_block_header(rpc, blockhash, True)
+    second = get_block_header(rpc, blockhash, True)
+    assert first == second
+    assert rpc.calls["getblockheader"][0] == 1
+
+def test_get_electrum_merkle_proof_cached():
+    rpc = DummyJsonRpc()
+    txid = "d3ad39fa52a89997ac7381c95eeffeaf40b66af7a57e9eba144be0a175a12b11"
+    blockhash = get_dummy_hash_from_height(1000)
+    for i in range(2):
+        proof = get_electrum_merkle_proof(rpc, txid, blockhash)
+        assert hash_merkle_root(proof["merkle"], txid, proof["pos"]) \
+            == proof["merkleroot"]
+    assert rpc.calls["gettxoutproof"][0] == 1
+
 def test_get_current_header():
     rpc = DummyJsonRpc()
     for raw in [True, False]:
@@ -134,6 +189,70 @@ def test_get_block_headers_hex(start_height, count):
     assert len(ret[0]) == expected_count*80*2 #80 bytes/header, 2 chars/byte
     assert ret[1] == expected_count
 
+@pytest.mark.parametrize(
+    "start_height, count",
+    [("0", 10),
+    (0, "10"),
+    (None, 10),
+    (1.5, 10)
+    ]
+)
+def test_get_block_headers_hex_bad_params(start_height, count):
+    rpc = DummyJsonRpc()
+    assert get_block_headers_hex(rpc, start_height, count) == ("", 0)
+
+def test_block_hash_cache():
+    block_hash_cache.clear()
+    rpc = DummyJsonRpc()
+    for i in range(2):
+        get_block_headers_hex(rpc, 1000, 10)
+        assert rpc.calls["getblockhash"][0] == 10
+    assert get_block_hash(rpc, 1005) == get_dummy_hash_from_height(1005)
+    assert rpc.calls["getblockhash"][0] == 10
+
+    #blocks close to the tip could still be reorganized so arent cached
+    tip_start_height = DUMMY_JSONRPC_BLOCKCHAIN_HEIGHT - 2
+    for i in range(2):
+        get_block_headers_hex(rpc, tip_start_height, 3)
+    assert rpc.calls["getblockhash"][0] == 16
+
+def test_block_hash_cache_lru(monkeypatch):
+    monkeypatch.setattr(electrumprotocol, "BLOCK_HASH_CACHE_SIZE", 3)
+    block_hash_cache.clear()
+    rpc = DummyJsonRpc()
+    for h in range(3):
+        cache_block_hash(h, get_dummy_hash_from_height(h), 100)
+    #using the oldest entry means the next one is evicted instead
+    assert get_block_hash(rpc, 0) == get_dummy_hash_from_height(0)
+    cache_block_hash(3, get_dummy_hash_from_height(3), 100)
+    assert sorted(block_hash_cache) == [0, 2, 3]
+    #reading a header refreshes its entry too
+    get_block_headers_hex(rpc, 2, 1)
+    cache_block_hash(4, get_dummy_hash_from_height(4), 100)
+    assert sorted(block_hash_cache) == [2, 3, 4]
+    block_hash_cache.clear()
+
+@pytest.mark.parametrize(
+    "method",
+    ["blockchain.block.header", "blockchain.block.get_header"]
+)
+@pytest.mark.parametrize(
+    "height",
+    [[5], {"height": 5}, "5"]
+)
+def test_block_header_bad_height(method, height):
+    block_hash_cache.clear()
+    protocol, sent_replies = create_electrum_protocol_instance()
+    #fill the block hash cache first
+    protocol.handle_query({"method": "blockchain.block.headers",
+        "params": [0, 10], "id": 0})
+    assert len(block_hash_cache) == 10
+    protocol.handle_query({"method": method, "params": [height], "id": 1})
+    assert len(sent_replies) == 2
+    assert sent_replies[1]["id"] == 1
+    assert "error" in sent_replies[1]
+    block_hash_cache.clear()
+
 @pytest.mark.parametrize(
     "invalid_json_query",
     [
@@ -261,6 +380,26 @@ def test_server_ping():
     assert sent_replies[0]["result"] == None
     assert sent_replies[0]["id"] == idd
 
+def test_server_banner_cached():
+    protocol, sent_replies = create_electrum_protocol_instance()
+    for i in range(2):
+        protocol.handle_query({"method": "server.banner", "params": [],
+            "id": i})
+    assert len(sent_replies) == 2
+    assert "Electrum Personal Server" in sent_replies[0]["result"]
+    assert sent_replies[0]["result"] == sent_replies[1]["result"]
+    assert protocol.rpc.calls["getnetworkinfo"][0] == 1
+
+    protocol.cached_banner_time -= 60
+    protocol.handle_query({"method": "server.banner", "params": [], "id": 2})
+    assert protocol.rpc.calls["getnetworkinfo"][0] == 2
+
+def test_unknown_method():
+    protocol, sent_replies = create_electrum_protocol_instance()
+    protocol.handle_query({"method": "server.does_not_exist", "params": [],
+        "id": 0})
+    assert len(sent_replies) == 0
+
 #test scripthash.subscribe, scripthash.get_history transaction.get
 # transaction.get_merkle
 
@@ -0,0 +1,75 @@
+
+import pytest
+
+from electrumpersonalserver.server.jsonrpc import (
+    JsonRpc,
+    JsonRpcError,
+    JsonRpcConnectionError
+)
+
+def create_jsonrpc(reply_fun):
+    #no connection is made until the first query, which is stubbed out here
+    rpc = JsonRpc("127.0.0.1", 8332, "user", "password")
+    requests = []
+    def query(request):
+        requests.append(request)
+        return reply_fun(request)
+    rpc._query_with_reconnect = query
+    return rpc, requests
+
+def reply_to_all(request):
+    #reply in reverse order, batch responses can come back in any order
+    return [{"result": [r["method"], r["params"]], "error": None,
+        "id": r["id"]} for r in reversed(request)]
+
+def test_batch_call():
+    rpc, requests = create_jsonrpc(reply_to_all)
+    results = rpc.batch_call([("getblockhash", [1]), ("getblockhash", [2]),
+        ("getblockcount", [])])
+    assert results == [["getblockhash", [1]], ["getblockhash", [2]],
+        ["getblockcount", []]]
+    assert len(requests) == 1
+    ids = [r["id"] for r in requests[0]]
+    assert len(set(ids)) == 3
+
+    rpc.batch_call([("getblockcount", [])])
+    assert requests[1][0]["id"] not in ids
+
+def test_batch_call_empty():
+    rpc, requests = create_jsonrpc(reply_to_all)
+    assert rpc.batch_call([]) == []
+    assert len(requests) == 0
+
+def test_batch_call_missing_id():
+    rpc, requests = create_jsonrpc(lambda request: reply_to_all(request)[1:])
+    with pytest.raises(JsonRpcConnectionError):
+        rpc.batch_call([("getblockhash", [1]), ("getblockhash", [2])])
+
+def test_batch_call_error_entry():
+    def reply(request):
+        response = reply_to_all(request)
+        response[0]["result"] = None
+        response[0]["error"] = {"code": -8, "message": "out of range"}
+        return response
+    rpc, requests = create_jsonrpc(reply)
+    with pytest.raises(JsonRpcError) as e:
+        rpc.batch_call([("getblockhash", [1]), ("getblockhash", [2])])
+    assert not isinstance(e.value, JsonRpcConnectionError)
+    assert e.value.args[0]["code"] == -8
+
+@pytest.mark.parametrize(
+    "response, expected_exception",
+    [
+        ({"result": None, "error": {"code": -32700, "message": "Parse error"},
+            "id": None}, JsonRpcError),
+        ({"result": None, "error": None, "id": None}, JsonRpcConnectionError),
+        (None, JsonRpcConnectionError),
+        ("not a list", JsonRpcConnectionError)
+    ]
+)
+def test_batch_call_not_a_list(response, expected_exception):
+    rpc, requests = create_jsonrpc(lambda request: response)
+    with pytest.raises(expected_exception) as e:
+        rpc.batch_call([("getblockhash", [1])])
+    if expected_exception is JsonRpcError:
+        assert not isinstance(e.value, JsonRpcConnectionError)
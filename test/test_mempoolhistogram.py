@@ -0,0 +1,73 @@
+
+import random
+from collections import defaultdict
+
+from electrumpersonalserver.server.jsonrpc import JsonRpcError
+from electrumpersonalserver.server.mempoolhistogram import (
+    MempoolSync,
+    calc_histogram
+)
+
+class DummyMempoolJsonRpc(object):
+    def __init__(self):
+        self.mempool = {}
+
+    def call(self, method, params):
+        if method == "getrawmempool":
+            return list(self.mempool.keys())
+        elif method == "getmempoolentry":
+            if params[0] not in self.mempool:
+                raise JsonRpcError()
+            base_fee, vsize = self.mempool[params[0]]
+            return {"fees": {"base": base_fee}, "vsize": vsize}
+        assert 0, "unknown method " + method
+
+def sync_mempool(mempool_sync):
+    #waiting -> gettxids -> getfeerates -> waiting
+    while True:
+        mempool_sync.poll_update(-1)
+        if mempool_sync.state == "waiting":
+            break
+
+def test_fee_histogram_incremental():
+    random.seed(0)
+    rpc = DummyMempoolJsonRpc()
+    mempool_sync = MempoolSync(rpc, False, 0)
+    txid_count = 0
+    histogram_bins = 0
+    for i in range(20):
+        for txid in random.sample(sorted(rpc.mempool),
+                min(len(rpc.mempool), random.randint(0, 30))):
+            del rpc.mempool[txid]
+        for j in range(random.randint(0, 40)):
+            #few distinct fee rates so txes share histogram buckets
+            vsize = random.choice([5000, 20000, 50000])
+            rpc.mempool["tx" + str(txid_count)] = (
+                random.randint(1, 5) * vsize / 1e8 * 10, vsize)
+            txid_count += 1
+        mempool_sync.state = "gettxids"
+        sync_mempool(mempool_sync)
+
+        assert set(mempool_sync.mempool) == set(rpc.mempool)
+        expected_fee_hist = defaultdict(int)
+        for fee_rate, size in mempool_sync.mempool.values():
+            expected_fee_hist[fee_rate] += size
+        assert dict(mempool_sync.fee_hist) == dict(expected_fee_hist)
+        assert 0 not in mempool_sync.fee_hist.values()
+        assert (mempool_sync.get_fee_histogram() ==
+            calc_histogram(expected_fee_hist))
+        histogram_bins += len(mempool_sync.get_fee_histogram())
+    #the mempool was big enough to fill some histogram bins
+    assert histogram_bins > 20
+
+def test_fee_histogram_empty_after_removals():
+    rpc = DummyMempoolJsonRpc()
+    mempool_sync = MempoolSync(rpc, False, 0)
+    rpc.mempool = {"a": (0.0001, 200), "b": (0.0001, 200), "c": (0.0005, 300)}
+    sync_mempool(mempool_sync)
+    assert len(mempool_sync.fee_hist) == 2
+    rpc.mempool = {}
+    mempool_sync.state = "gettxids"
+    sync_mempool(mempool_sync)
+    assert len(mempool_sync.fee_hist) == 0
+    assert mempool_sync.get_fee_histogram() == []
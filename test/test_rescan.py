@@ -0,0 +1,209 @@
+
+import pytest
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from electrumpersonalserver.server import JsonRpcError
+import electrumpersonalserver.server.common as common
+from electrumpersonalserver.server.common import (
+    search_for_block_height_of_date,
+    rescan_script,
+    header_by_height
+)
+
+logger = logging.getLogger('ELECTRUMPERSONALSERVER-TEST')
+logger.setLevel(logging.DEBUG)
+
+class DummyChainJsonRpc(object):
+    def __init__(self, block_times):
+        self.block_times = block_times
+        #each test uses a different chain
+        header_by_height.clear()
+        self.calls = []
+        self.round_trips = 0
+        self.rescan_heights = []
+
+    def call(self, method, params):
+        self.round_trips += 1
+        return self.handle_call(method, params)
+
+    def handle_call(self, method, params):
+        self.calls.append(method)
+        if method == "getbestblockhash":
+            return "%064x" % (len(self.block_times) - 1)
+        elif method == "getblockhash":
+            if not 0 <= params[0] < len(self.block_times):
+                raise JsonRpcError({"code": -8,
+                    "message": "Block height out of range"})
+            return "%064x" % params[0]
+        elif method == "getblockheader":
+            height = int(params[0], 16)
+            return {"hash": params[0], "height": height,
+                "time": self.block_times[height]}
+        elif method == "rescanblockchain":
+            self.rescan_heights.append(params[0])
+            return {"start_height": params[0],
+                "stop_height": len(self.block_times) - 1}
+        assert 0, "unknown method " + method
+
+    def batch_call(self, calls):
+        self.round_trips += 1
+        return [self.handle_call(method, params) for method, params in calls]
+
+def make_block_times(start_date, block_intervals):
+    block_times = []
+    t = int(datetime.strptime(start_date, "%d/%m/%Y").timestamp())
+    for interval in block_intervals:
+        block_times.append(t)
+        t += interval
+    return block_times
+
+@pytest.mark.parametrize(
+    "block_intervals",
+    [
+        [600]*100000,
+        #slow blocks at the start then many fast blocks, like testnet
+        [5000]*8000 + [30]*100000
+    ]
+)
+def test_search_for_block_height_of_date(block_intervals):
+    block_times = make_block_times("01/01/2015", block_intervals)
+    rpc = DummyChainJsonRpc(block_times)
+    for datestr in ["01/02/2015", "10/03/2016", "01/05/2016"]:
+        target_time = datetime.strptime(datestr, "%d/%m/%Y").timestamp()
+        if target_time >= block_times[-1]:
+            continue
+        height = search_for_block_height_of_date(datestr, rpc)
+        assert abs(block_times[height] - target_time) < 60*60*2
+
+@pytest.mark.parametrize("use_pool", [False, True])
+def test_search_for_block_height_of_date_no_close_block(use_pool):
+    #blocks 53 hours apart so none is within the tolerance of the date
+    block_times = make_block_times("01/01/2015", [53*60*60]*1000)
+    rpc = DummyChainJsonRpc(block_times)
+    datestr = "02/03/2015"
+    target_time = datetime.strptime(datestr, "%d/%m/%Y").timestamp()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        height = search_for_block_height_of_date(datestr, rpc,
+            pool if use_pool else None)
+    assert block_times[height] < target_time - 60*60*2
+    assert block_times[height + 1] > target_time + 60*60*2
+
+def test_search_for_block_height_of_date_out_of_range():
+    rpc = DummyChainJsonRpc(make_block_times("01/01/2015", [600]*1000))
+    assert search_for_block_height_of_date("01/01/2014", rpc) == 0
+    assert search_for_block_height_of_date("01/01/2016", rpc) == -1
+
+def test_search_for_block_height_of_date_interpolates():
+    rpc = DummyChainJsonRpc(make_block_times("01/01/2015", [600]*500000))
+    search_for_block_height_of_date("20/03/2020", rpc)
+    #bisection would need around 36 round trips
+    assert rpc.round_trips <= 8
+
+def test_search_for_block_height_of_date_cached():
+    rpc = DummyChainJsonRpc(make_block_times("01/01/2015", [600]*100000))
+    height = search_for_block_height_of_date("10/03/2016", rpc)
+    calls = len(rpc.calls)
+    assert search_for_block_height_of_date("10/03/2016", rpc) == height
+    #only the two ends of the chain are fetched again
+    assert len(rpc.calls) - calls == 4
+
+def test_search_for_block_height_of_date_pool():
+    block_times = make_block_times("01/01/2015", [5000]*8000 + [30]*100000)
+    rpc = DummyChainJsonRpc(block_times)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        for datestr in ["01/02/2015", "10/03/2016", "01/05/2016"]:
+            target_time = datetime.strptime(datestr, "%d/%m/%Y").timestamp()
+            height = search_for_block_height_of_date(datestr, rpc, pool)
+            assert abs(block_times[height] - target_time) < 60*60*2
+
+def test_rescan_script():
+    rpc = DummyChainJsonRpc(make_block_times("01/01/2015", [600]*100000))
+    rescan_script(logger, rpc, "5000")
+    #going back two weeks from near genesis is clamped to zero
+    rescan_script(logger, rpc, "03/01/2015")
+    #heights past the tip dont start a rescan
+    rescan_script(logger, rpc, "200000")
+    assert rpc.rescan_heights == [5000, 0]
+
+class DummyConnection(object):
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class DummySlowRescanJsonRpc(DummyChainJsonRpc):
+    def __init__(self, block_times, walletinfo_errors=[]):
+        super().__init__(block_times)
+        self.conn = DummyConnection()
+        self.rescan_progress_polled = threading.Event()
+        self.walletinfo_errors = list(walletinfo_errors)
+
+    def handle_call(self, method, params):
+        if method == "rescanblockchain":
+            #only finish once the progress has been checked
+            assert self.rescan_progress_polled.wait(5)
+        elif method == "getwalletinfo":
+            if len(self.walletinfo_errors) > 0:
+                raise self.walletinfo_errors.pop(0)
+            self.rescan_progress_polled.set()
+            return {"scanning": {"duration": 1, "progress": 0.5}}
+        elif method == "abortrescan":
+            assert self.conn.closed
+            self.rescan_progress_polled.set()
+            raise JsonRpcError({"code": -1, "message": "abort failed"})
+        return super().handle_call(method, params)
+
+def test_rescan_script_polls_progress(monkeypatch):
+    monkeypatch.setattr(common, "RESCAN_PROGRESS_INTERVAL", 0.01)
+    rpc = DummySlowRescanJsonRpc(make_block_times("01/01/2015", [600]*1000))
+    rescan_script(logger, rpc, "500")
+    assert rpc.rescan_heights == [500]
+    assert rpc.rescan_progress_polled.is_set()
+
+def test_rescan_script_progress_error(monkeypatch):
+    monkeypatch.setattr(common, "RESCAN_PROGRESS_INTERVAL", 0.01)
+    rpc = DummySlowRescanJsonRpc(make_block_times("01/01/2015", [600]*1000),
+        [JsonRpcError({"code": -1, "message": "busy"})])
+    rescan_script(logger, rpc, "500")
+    assert rpc.rescan_heights == [500]
+    assert rpc.rescan_progress_polled.is_set()
+
+def test_rescan_script_interrupted(monkeypatch):
+    monkeypatch.setattr(common, "RESCAN_PROGRESS_INTERVAL", 0.01)
+    rpc = DummySlowRescanJsonRpc(make_block_times("01/01/2015", [600]*1000),
+        [KeyboardInterrupt()])
+    #a failed abortrescan is logged rather than raised
+    rescan_script(logger, rpc, "500")
+    #only set by abortrescan, after the connection was closed
+    assert rpc.rescan_progress_polled.is_set()
+
+def test_rescan_script_no_prompts(monkeypatch):
+    def no_input(prompt):
+        assert 0, "unexpected prompt " + prompt
+    monkeypatch.setattr("builtins.input", no_input)
+    rpc = DummyChainJsonRpc(make_block_times("01/01/2015", [600]*100000))
+    rescan_script(logger, rpc, None, from_height=5000, assume_yes=True)
+    rescan_script(logger, rpc, None, from_date="10/01/2015", assume_yes=True)
+    assert rpc.rescan_heights[0] == 5000
+    #less than two weeks after the first block so clamped to zero
+    assert rpc.rescan_heights[1] == 0
+
+def test_rescan_script_confirm(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+    rpc = DummyChainJsonRpc(make_block_times("01/01/2015", [600]*1000))
+    rescan_script(logger, rpc, None, from_height=500)
+    assert rpc.rescan_heights == []
+
+def test_rescan_script_from_date_not_height(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+    rpc = DummyChainJsonRpc(make_block_times("01/01/2015", [600]*1000))
+    #an integer is not a date and must not be taken as a block height
+    rescan_script(logger, rpc, None, from_date="500", assume_yes=True)
+    rescan_script(logger, rpc, None, from_date="32/13/2015", assume_yes=True)
+    rescan_script(logger, rpc, "not a date")
+    assert rpc.rescan_heights == []
+    assert "getblockhash" not in rpc.calls
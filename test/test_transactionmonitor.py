@@ -641,3 +641,31 @@ def test_single_tx_no_address_key():
     assert_address_history_tx(txmonitor.address_history, spk=dummy_spk,
         height=containing_block_height, txid=dummy_tx["txid"], subscribed=False)
 
+
+def test_wallet_derived_addresses_cached():
+    ### requesting already-derived addresses again shouldnt derive them again
+    class CountingWallet(DeterministicWallet):
+        def __init__(self, rpc):
+            super(CountingWallet, self).__init__(rpc)
+            self.derived = []
+
+        def _derive_addresses(self, change, from_index, count):
+            self.derived.append((change, from_index, count))
+            return [dummy_spk_to_address(str(change) + "-" + str(i))
+                for i in range(from_index, from_index + count)]
+
+    class AddressRpc(object):
+        def batch_call(self, calls):
+            return [{"scriptPubKey": params[0][:-len("-address")]}
+                for method, params in calls]
+
+    wal = CountingWallet(AddressRpc())
+    addrs, spks = wal.get_addresses(change=0, from_index=0, count=3)
+    assert spks == ["0-0", "0-1", "0-2"]
+    wal.get_addresses(change=0, from_index=9, count=1)
+    addrs, spks = wal.get_addresses(change=0, from_index=0, count=10)
+    assert spks == ["0-" + str(i) for i in range(10)]
+    assert wal.derived == [(0, 0, 3), (0, 9, 1), (0, 3, 6)]
+    wal.get_addresses(change=0, from_index=2, count=5)
+    assert len(wal.derived) == 3
+    assert wal.next_index[0] == 10